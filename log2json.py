@@ -4,30 +4,88 @@
 log2json.py - Extract data from log files using ripgrep, generate JSON for json2html
 
 Usage: python log2json.py <log_file> <config1.py> [config2.py ...] [-o output.json]
+                          [--line-index] [--no-msg] [--max-memory <size>]
+                          [--aggregate <bucket_ms> [--gap-percentiles 50,90,99]]
+                          [--sqlite <db>]
+
+Options:
+    -o <file>       Output JSON file
+    -n <name>       Output JSON name field
+    --line-index    Write a line-offset index next to the log (<log>.lineidx,
+                    e.g. logcat.1.lineidx, or <output>.lineidx if the log
+                    directory is read-only)
+                    so serve.py can return raw log context
+    --no-msg        Omit msg from points (implies --line-index); the viewer
+                    fetches line text on demand through serve.py /lines/
+                    (messages stay blank under the vite dev server)
+    --max-memory <size>
+                    Memory budget for collected points (e.g. 512M, 2G; plain
+                    numbers are MB). Points over budget spill to sorted temp
+                    files and are merged while writing the output. With
+                    --gap-percentiles, budget for series timestamps
+                    (default 64M)
+    --aggregate <ms>
+                    Write event counts per (classname, subclassname, layer)
+                    over <ms> wide time buckets instead of every point
+    --gap-percentiles <p,...>
+                    With --aggregate, add percentiles of the time gaps
+                    between consecutive events of each series (gaps over
+                    128 ms are rounded down by under 1.6%)
+    --sqlite <db>   Write points into an indexed SQLite database instead of
+                    JSON. Many logs can share one database; re-running a log
+                    replaces its previous rows. serve.py /sqlite/ queries it.
+                    The line index is written as <db stem>.<log id>.lineidx;
+                    max_points drop counts go to the dropped table
 
 Examples:
     python log2json.py log/1.log configs/audio.py configs/system.py
     python log2json.py log/1.log configs/*.py -o result.json
+    python log2json.py log/1.log configs/*.py --no-msg
+    python log2json.py log/1.log configs/*.py --aggregate 1000 --gap-percentiles 50,99
+    python log2json.py log/1.log configs/*.py --sqlite logs.db
+
+Library usage:
+    from log2json import LogExtractor, Log2JsonError
+    
+    extractor = LogExtractor(['qlcfg/audio.py', 'qlcfg/system.py'])
+    for point in extractor.iter_points('log/1.log'):
+        print(point['classname'], point['subclassname'], point['cursor'])
+    # CLI JSON format; points stay in memory and process_json errors raise
+    result = extractor.extract('log/2.log', line_index='log/2.lineidx')
 """
 
+import base64
 import json
 import sys
 import subprocess
 import re
 import os
 import glob
+import heapq
+import pickle
+import random
+import sqlite3
+import tempfile
+import time
 import importlib.util
+from array import array
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
-from typing import Optional, List, Dict, Any, Callable, Union
+from operator import itemgetter
+from typing import Optional, List, Dict, Any, Callable, Union, Iterator, Tuple, IO
+
+
+class Log2JsonError(Exception):
+    """Base class for log2json errors."""
+
+
+class ConfigError(Log2JsonError):
+    """Config file missing, unsupported or failed to load."""
 
 
-# Fix Windows console encoding
-if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+class RipgrepError(Log2JsonError):
+    """ripgrep could not be run or reported an error."""
 
 
 def get_rg_path() -> str:
@@ -40,6 +98,81 @@ def get_rg_path() -> str:
 
 RG_PATH = get_rg_path()
 
+LINE_INDEX_SUFFIX = '.lineidx'
+
+
+def build_line_index(log_file: str, chunk_size: int = 16 * 1024 * 1024) -> array:
+    """
+    Build line-number-to-byte-offset index of a log file.
+    
+    offsets[n - 1] is the byte offset where line n starts (1-based, same
+    numbering as rg). The last entry is the file size, so line n spans
+    offsets[n - 1]:offsets[n] and the line count is len(offsets) - 1.
+    
+    Args:
+        log_file: Log file path
+        chunk_size: Read chunk size in bytes
+    
+    Returns:
+        array('Q') of byte offsets
+    """
+    offsets = array('Q', [0])
+    pos = 0
+    with open(log_file, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            find = chunk.find
+            i = find(b'\n')
+            while i != -1:
+                offsets.append(pos + i + 1)
+                i = find(b'\n', i + 1)
+            pos += len(chunk)
+    
+    # Last line without trailing newline
+    if offsets[-1] != pos:
+        offsets.append(pos)
+    return offsets
+
+
+def write_line_index(offsets: array, index_file: str) -> None:
+    """Write line index as little-endian uint64 array."""
+    if sys.byteorder == 'big':
+        offsets = array('Q', offsets)
+        offsets.byteswap()
+    with open(index_file, 'wb') as f:
+        offsets.tofile(f)
+
+
+def read_line_index(index_file: str) -> array:
+    """Read line index written by write_line_index."""
+    offsets = array('Q')
+    with open(index_file, 'rb') as f:
+        offsets.frombytes(f.read())
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets
+
+
+def write_source_index(log_file: str, index_file: str) -> Dict[str, Any]:
+    """
+    Build and write the line index of a log.
+    
+    Returns:
+        'source' info of the result: log path, line index path, line count
+    """
+    offsets = build_line_index(log_file)
+    write_line_index(offsets, index_file)
+    return {
+        'log': str(Path(log_file).absolute()),
+        'line_index': str(Path(index_file).absolute()),
+        'lines': len(offsets) - 1
+    }
+
+
+LOGCAT_TIMESTAMP_RE = re.compile(r'^(\d{2})-(\d{2})\s+(\d{2}):(\d{2}):(\d{2})\.(\d{3})')
+
 
 def parse_logcat_timestamp(line: str, base_year: Optional[int] = None) -> int:
     """
@@ -59,7 +192,7 @@ def parse_logcat_timestamp(line: str, base_year: Optional[int] = None) -> int:
     if base_year is None:
         base_year = datetime.now().year
     
-    match = re.match(r'^(\d{2})-(\d{2})\s+(\d{2}):(\d{2}):(\d{2})\.(\d{3})', line)
+    match = LOGCAT_TIMESTAMP_RE.match(line)
     if match:
         month, day, hour, minute, second, ms = match.groups()
         try:
@@ -72,66 +205,107 @@ def parse_logcat_timestamp(line: str, base_year: Optional[int] = None) -> int:
     return 0
 
 
-def run_rg_json(pattern: str, log_file: str) -> List[Dict[str, Any]]:
+def rg_text(data: Dict[str, str]) -> str:
+    """Text of an rg --json data object; non-UTF-8 lines come as base64 'bytes'."""
+    if 'text' in data:
+        return data['text']
+    return base64.b64decode(data.get('bytes', '')).decode('utf-8', errors='replace')
+
+
+def iter_rg_json(pattern: str, log_file: str) -> Iterator[Dict[str, Any]]:
     """
-    Run rg --json command and parse output.
+    Run rg --json command and stream parsed matches.
     
     Args:
         pattern: Regex pattern
         log_file: Log file path
     
-    Returns:
-        List of match results with line_number, line_text, submatches
+    Yields:
+        Match results with line_number, line_text, submatches
+    
+    Raises:
+        RipgrepError: rg not found, failed to start or reported an error
     """
+    # stderr goes to a temp file: a pipe could fill up and block rg
+    stderr = tempfile.TemporaryFile()
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             [RG_PATH, "--json", "-e", pattern, log_file],
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
             text=True,
             encoding='utf-8',
             errors='replace'
         )
-        
-        matches = []
-        for line in result.stdout.strip().split('\n'):
-            if not line:
-                continue
+    except FileNotFoundError:
+        stderr.close()
+        raise RipgrepError("ripgrep not found, please ensure rg is in PATH or rg/ directory")
+    except OSError as e:
+        stderr.close()
+        raise RipgrepError(f"Error running rg: {e}")
+    
+    try:
+        for line in proc.stdout:
             try:
                 data = json.loads(line)
-                if data.get('type') == 'match':
-                    match_data = data['data']
-                    matches.append({
-                        'line_number': match_data['line_number'],
-                        'line_text': match_data['lines']['text'].strip(),
-                        'submatches': match_data.get('submatches', [])
-                    })
             except json.JSONDecodeError:
                 continue
+            if data.get('type') != 'match':
+                continue
+            match_data = data['data']
+            yield {
+                'line_number': match_data['line_number'],
+                'line_text': rg_text(match_data['lines']).strip(),
+                'submatches': match_data.get('submatches', [])
+            }
         
-        return matches
+        # Exit code 1 only means no match; 2 is an error (bad pattern, unreadable log)
+        if proc.wait() == 2:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', errors='replace').strip()
+            raise RipgrepError(f"rg failed for pattern {pattern!r}: {message or 'exit code 2'}")
+    finally:
+        # Consumer may stop early
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        stderr.close()
+
+
+def run_rg_json(pattern: str, log_file: str) -> List[Dict[str, Any]]:
+    """
+    Run rg --json command and parse output.
     
-    except FileNotFoundError:
-        print("❌ Error: ripgrep not found, please ensure rg is in PATH or rg/ directory")
-        sys.exit(1)
-    except Exception as e:
-        print(f"⚠️ Error running rg: {e}")
-        return []
+    Args:
+        pattern: Regex pattern
+        log_file: Log file path
+    
+    Returns:
+        List of match results with line_number, line_text, submatches
+    """
+    return list(iter_rg_json(pattern, log_file))
 
 
-def extract_cursor(line: str, cursor_pattern: str, default: str = "MATCH") -> str:
+def extract_cursor(
+    line: str,
+    cursor_pattern: Union[str, 're.Pattern'],
+    default: str = "MATCH"
+) -> str:
     """
     Extract cursor (identifier) from log line.
     
     Args:
         line: Log line
-        cursor_pattern: Regex pattern for cursor extraction
+        cursor_pattern: Regex pattern (or compiled pattern) for cursor extraction
         default: Default value
     
     Returns:
         Extracted cursor or default value
     """
     if cursor_pattern:
-        match = re.search(cursor_pattern, line)
+        match = re.search(cursor_pattern, line) if isinstance(cursor_pattern, str) \
+            else cursor_pattern.search(line)
         if match:
             cursor = match.group(0).strip()
             cursor = re.sub(r'[^\w\-_.]', '_', cursor)
@@ -153,16 +327,17 @@ def load_config(config_path: str) -> Dict[str, Any]:
     
     Returns:
         Configuration dictionary
+    
+    Raises:
+        ConfigError: File missing, not .py or failed to import
     """
     path = Path(config_path)
     
     if not path.exists():
-        print(f"❌ Config file not found: {config_path}")
-        sys.exit(1)
+        raise ConfigError(f"Config file not found: {config_path}")
     
     if path.suffix != '.py':
-        print(f"❌ Only .py config files are supported: {config_path}")
-        sys.exit(1)
+        raise ConfigError(f"Only .py config files are supported: {config_path}")
     
     try:
         spec = importlib.util.spec_from_file_location("config", config_path)
@@ -173,18 +348,45 @@ def load_config(config_path: str) -> Dict[str, Any]:
             'classname': getattr(module, 'classname', 'Unnamed'),
             'subclasses': getattr(module, 'subclasses', []),
             'process_json': getattr(module, 'process_json', None),
-            '_module': module
+            '_module': module,
+            '_path': config_path
         }
     except Exception as e:
-        print(f"❌ Failed to load config {config_path}: {e}")
-        sys.exit(1)
+        raise ConfigError(f"Failed to load config {config_path}: {e}") from e
+
+
+class LineBitmap:
+    """Set of line numbers as a growable bit array (1 bit per line)."""
+    
+    def __init__(self):
+        self.bits = bytearray()
+    
+    def add(self, line_num: int) -> bool:
+        """Mark a line, return False if it was already marked."""
+        byte = line_num >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+        mask = 1 << (line_num & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        return True
+    
+    def __contains__(self, line_num: int) -> bool:
+        byte = line_num >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (line_num & 7)))
+
+
+# Matches resolved together per rule (size of the lists vectorized callables get)
+CALLABLE_BATCH = 4096
 
 
 def resolve_callable(
     value: Union[str, int, Callable],
     line: str,
     match: Dict[str, Any],
-    default: Union[str, int]
+    default: Union[str, int],
+    on_error: Optional[Callable[[Exception], None]] = None
 ) -> Union[str, int]:
     """
     Resolve a value that may be a callable or static value.
@@ -194,6 +396,7 @@ def resolve_callable(
         line: Log line text
         match: Match info dictionary
         default: Default value on failure
+        on_error: Called with the exception when the callable fails
     
     Returns:
         Resolved value
@@ -201,15 +404,431 @@ def resolve_callable(
     if callable(value):
         try:
             return value(line, match)
-        except Exception:
+        except Exception as e:
+            if on_error:
+                on_error(e)
             return default
     return value
 
 
+def resolve_batch(
+    value: Union[str, int, Callable],
+    lines: List[str],
+    matches: List[Dict[str, Any]],
+    defaults: List[Union[str, int]],
+    on_error: Optional[Callable[[Exception], None]] = None,
+    on_batch_error: Optional[Callable[[Exception], None]] = None
+) -> List[Union[str, int]]:
+    """
+    Resolve a value for a batch of lines.
+    
+    Callables with a truthy `vectorized` attribute are called once as
+    (lines, matches) -> list of results. If that call fails or returns the
+    wrong number of results, each line is retried alone so only failing
+    lines get their default. Other callables are called per line.
+    
+    Args:
+        value: Static value, callable (line, match) -> result or
+            vectorized callable (lines, matches) -> results
+        lines: Log line texts
+        matches: Match info dictionaries
+        defaults: Default value per line on failure
+        on_error: Called with the exception for every failed line
+        on_batch_error: Called with the exception when the whole-batch call
+            of a vectorized callable fails (before the per-line retry)
+    
+    Returns:
+        Resolved value per line
+    """
+    if not callable(value):
+        return [value] * len(lines)
+    
+    if not getattr(value, 'vectorized', False):
+        return [resolve_callable(value, line, match, default, on_error)
+                for line, match, default in zip(lines, matches, defaults)]
+    
+    try:
+        results = list(value(lines, matches))
+        if len(results) == len(lines):
+            return results
+        raise ValueError(f"vectorized callable returned {len(results)} results for {len(lines)} lines")
+    except Exception as e:
+        if on_batch_error:
+            on_batch_error(e)
+    
+    results = []
+    for line, match, default in zip(lines, matches, defaults):
+        try:
+            result = list(value([line], [match]))
+            if len(result) != 1:
+                raise ValueError(f"vectorized callable returned {len(result)} results for 1 line")
+            results.append(result[0])
+        except Exception as e:
+            if on_error:
+                on_error(e)
+            results.append(default)
+    return results
+
+
+def error_counter(errors: Dict[Tuple[str, str], Dict[str, Any]], pattern: str, field: str) -> Callable:
+    """
+    on_error callback counting failures of a rule's callable.
+    
+    errors[(pattern, field)] = {'count': failures, 'error': first error}
+    
+    Failed whole-batch calls of vectorized callables use field '<field>:batch'.
+    """
+    def on_error(e: Exception) -> None:
+        entry = errors.get((pattern, field))
+        if entry is None:
+            entry = errors[(pattern, field)] = {'count': 0, 'error': f"{type(e).__name__}: {e}"}
+        entry['count'] += 1
+    return on_error
+
+
+def print_callable_errors(errors: Dict[Tuple[str, str], Dict[str, Any]]) -> None:
+    """Report callable failures collected by error_counter."""
+    for (pattern, field), entry in errors.items():
+        if field.endswith(':batch'):
+            print(f"   ⚠️ {field} failed {entry['count']}x for '{pattern}' (retried per line): {entry['error']}")
+        else:
+            print(f"   ⚠️ {field} failed {entry['count']}x for '{pattern}' (defaults used): {entry['error']}")
+
+
+SAMPLING_STRATEGIES = ('first', 'reservoir', 'stratified')
+
+
+class PointSampler:
+    """
+    Keeps at most max_points of a stream of items.
+    
+    Strategies:
+    - first: the first max_points items
+    - reservoir: uniform random sample (bottom-k of a random key per item)
+    - stratified: uniform sample within time strata; strata start 1 ms
+      wide and double (merging their samples) while there are more than
+      STRATA of them, so the time range need not be known up front.
+      Items without timestamp form their own stratum, which can keep up to
+      max_points items (logs whose lines have no parseable timestamp are
+      then a plain uniform sample). Each timed stratum keeps up to
+      2 * max_points / STRATA items. items() shares max_points evenly
+      across strata, giving what sparse strata leave unused to the others.
+      Timestamps clustered in a few strata can still yield fewer than
+      max_points.
+    
+    Sampling is seeded, so the same log gives the same output.
+    """
+    
+    STRATA = 100
+    
+    def __init__(self, max_points: int, strategy: str = 'first', seed: int = 0):
+        self.max_points = max_points
+        self.strategy = strategy
+        self.needs_time = strategy == 'stratified'
+        self.seen = 0
+        self._rng = random.Random(seed)
+        self._items: List[Any] = []
+        # stratified: bucket -> max-heap of (-key, index, item)
+        self._buckets: Dict[Optional[int], List[Tuple[float, int, Any]]] = {}
+        self._width = 1
+        # Doubling leaves STRATA / 2 .. STRATA strata, so 2x the even share fills max_points
+        self._capacity = max(1, -(-2 * max_points // self.STRATA))
+    
+    @property
+    def dropped(self) -> int:
+        return self.seen - len(self.items())
+    
+    def offer(self, item: Any, timestamp: int = 0) -> None:
+        index = self.seen
+        self.seen += 1
+        
+        if self.strategy == 'first':
+            if index < self.max_points:
+                self._items.append(item)
+        elif self.strategy == 'reservoir':
+            self._push(self._items, self.max_points, (-self._rng.random(), index, item))
+        else:
+            bucket = timestamp // self._width if timestamp else None
+            heap = self._buckets.setdefault(bucket, [])
+            self._push(heap, self._stratum_capacity(bucket), (-self._rng.random(), index, item))
+            if len(self._buckets) > self.STRATA + 1:
+                self._widen()
+    
+    @staticmethod
+    def _push(heap: List[Tuple[float, int, Any]], capacity: int, entry: Tuple[float, int, Any]) -> None:
+        if capacity <= 0:
+            return
+        if len(heap) < capacity:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+    
+    def _stratum_capacity(self, bucket: Optional[int]) -> int:
+        # Without timestamps everything lands in the untimed stratum; let it
+        # hold a full sample so _share_strata can give it what timed ones leave
+        return self.max_points if bucket is None else self._capacity
+    
+    def _widen(self) -> None:
+        """Double stratum width until at most STRATA timed strata remain."""
+        while len(self._buckets) > self.STRATA + 1:
+            self._width *= 2
+            merged: Dict[Optional[int], List[Tuple[float, int, Any]]] = {}
+            for bucket, heap in self._buckets.items():
+                target_bucket = None if bucket is None else bucket // 2
+                target = merged.setdefault(target_bucket, [])
+                for entry in heap:
+                    self._push(target, self._stratum_capacity(target_bucket), entry)
+            self._buckets = merged
+    
+    def items(self) -> List[Any]:
+        """Kept items in arrival order."""
+        if self.strategy == 'first':
+            return self._items
+        if self.strategy == 'reservoir':
+            entries = self._items
+        else:
+            entries = self._share_strata()
+        return [item for _, _, item in sorted(entries, key=itemgetter(1))]
+    
+    def _share_strata(self) -> List[Tuple[float, int, Any]]:
+        """Up to max_points entries, split as evenly as stratum sizes allow."""
+        heaps = sorted(self._buckets.items(),
+                       key=lambda kv: (len(kv[1]), kv[0] is not None, kv[0] or 0))
+        entries = []
+        remaining = self.max_points
+        for i, (_, heap) in enumerate(heaps):
+            left = len(heaps) - i
+            share = remaining // left + (1 if remaining % left else 0)
+            take = min(len(heap), share)
+            entries.extend(heap if take == len(heap) else heapq.nlargest(take, heap, key=itemgetter(0)))
+            remaining -= take
+        return entries
+
+
+def compile_sampling(spec: Dict[str, Any], where: str) -> Optional[Tuple[int, str]]:
+    """
+    Validate max_points / sampling of a rule or subclass config.
+    
+    Returns:
+        (max_points, strategy) or None when unlimited
+    
+    Raises:
+        ConfigError: Invalid max_points or unknown strategy
+    """
+    max_points = spec.get('max_points')
+    if max_points is None:
+        return None
+    strategy = spec.get('sampling', 'first')
+    if not isinstance(max_points, int) or max_points < 0:
+        raise ConfigError(f"Invalid max_points in {where}: {max_points!r}")
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ConfigError(f"Unknown sampling in {where}: {strategy!r} "
+                          f"(expected one of {', '.join(SAMPLING_STRATEGIES)})")
+    return max_points, strategy
+
+
+def compile_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pre-compile rules of a loaded config for repeated extraction.
+    
+    Stores the normalized rules under config['_compiled'] as a list of
+    (subclassname_cfg, [rule, ...], sampling) and returns the config.
+    
+    Args:
+        config: Configuration dictionary from load_config
+    
+    Returns:
+        The same configuration dictionary
+    
+    Raises:
+        ConfigError: Invalid max_points / sampling
+    """
+    if '_compiled' in config:
+        return config
+    
+    compiled = []
+    for sub_config in config.get('subclasses', []):
+        subclassname_cfg = sub_config.get('subclassname', 'Unnamed')
+        rules = []
+        for rule in sub_config.get('rules', []):
+            pattern = rule.get('pattern', '')
+            if not pattern:
+                continue
+            cursor_pattern = rule.get('cursor_pattern', '')
+            rules.append({
+                'pattern': pattern,
+                'cursor': rule.get('cursor'),
+                'cursor_re': re.compile(cursor_pattern) if cursor_pattern else None,
+                'cursor_prefix': rule.get('cursor_prefix', ''),
+                'layer': rule.get('layer', 1),
+                'sampling': compile_sampling(rule, f"rule '{pattern}'")
+            })
+        where = f"subclass '{getattr(subclassname_cfg, '__name__', subclassname_cfg)}'"
+        compiled.append((subclassname_cfg, rules, compile_sampling(sub_config, where)))
+    
+    config['_compiled'] = compiled
+    return config
+
+
+def iter_config_points(
+    config: Dict[str, Any],
+    log_file: str,
+    base_year: Optional[int] = None,
+    include_msg: bool = True,
+    errors: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None,
+    dropped: Optional[Dict[str, Dict[str, int]]] = None,
+    sample: bool = True
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream matched points of a single config.
+    
+    Each log line is reported at most once per config (first matching rule
+    wins). Points of one rule come in line order. Matches are resolved in
+    batches of CALLABLE_BATCH so vectorized callables are called once per
+    batch.
+    
+    Rules with max_points are sampled before their callables run and are
+    yielded after the rule's last match. Subclasses with max_points are
+    sampled per resulting subclassname and yielded after their last rule.
+    
+    Args:
+        config: Configuration dictionary
+        log_file: Log file path
+        base_year: Base year for timestamp parsing
+        include_msg: Store matched line text in msg
+        errors: Filled with callable failure counts (see error_counter)
+        dropped: Filled with matches dropped by max_points as
+            {'rules': {pattern: n}, 'subclasses': {subclassname: n}}
+        sample: Apply max_points limits
+    
+    Yields:
+        (subclassname, point) tuples
+    """
+    if errors is None:
+        errors = {}
+    if dropped is None:
+        dropped = {}
+    dropped_rules = dropped.setdefault('rules', {})
+    dropped_subclasses = dropped.setdefault('subclasses', {})
+    seen_lines = LineBitmap()
+    
+    for subclassname_cfg, rules, sub_sampling in compile_config(config)['_compiled']:
+        subclass_samplers: Optional[Dict[str, PointSampler]] = {} if sample and sub_sampling else None
+        
+        def emit(points):
+            if subclass_samplers is None:
+                yield from points
+                return
+            for subclassname, point in points:
+                sampler = subclass_samplers.get(subclassname)
+                if sampler is None:
+                    sampler = subclass_samplers[subclassname] = PointSampler(*sub_sampling)
+                sampler.offer(point, point['timestamp'])
+        
+        for rule in rules:
+            pattern = rule['pattern']
+            on_error = {
+                field: error_counter(errors, pattern, field)
+                for field in ('subclassname', 'cursor', 'layer',
+                              'subclassname:batch', 'cursor:batch', 'layer:batch')
+            }
+            rule_sampler = PointSampler(*rule['sampling']) if sample and rule['sampling'] else None
+            
+            batch = []
+            for match in iter_rg_json(pattern, log_file):
+                if not seen_lines.add(match['line_number']):
+                    continue
+                if rule_sampler is not None:
+                    timestamp = parse_logcat_timestamp(match['line_text'], base_year) \
+                        if rule_sampler.needs_time else 0
+                    rule_sampler.offer(match, timestamp)
+                    continue
+                batch.append(match)
+                if len(batch) >= CALLABLE_BATCH:
+                    yield from emit(resolve_points(subclassname_cfg, rule, batch, base_year, include_msg, on_error))
+                    batch = []
+            
+            if rule_sampler is not None:
+                kept = rule_sampler.items()
+                if rule_sampler.dropped:
+                    dropped_rules[pattern] = dropped_rules.get(pattern, 0) + rule_sampler.dropped
+                for i in range(0, len(kept), CALLABLE_BATCH):
+                    yield from emit(resolve_points(subclassname_cfg, rule, kept[i:i + CALLABLE_BATCH],
+                                                   base_year, include_msg, on_error))
+            elif batch:
+                yield from emit(resolve_points(subclassname_cfg, rule, batch, base_year, include_msg, on_error))
+        
+        if subclass_samplers:
+            for subclassname, sampler in subclass_samplers.items():
+                if sampler.dropped:
+                    dropped_subclasses[subclassname] = dropped_subclasses.get(subclassname, 0) + sampler.dropped
+                for point in sampler.items():
+                    yield subclassname, point
+
+
+def print_dropped(dropped: Dict[str, Dict[str, int]]) -> None:
+    """Report matches dropped by max_points."""
+    for pattern, count in dropped.get('rules', {}).items():
+        print(f"   ✂️ Dropped {count} matches of rule '{pattern}' (max_points)")
+    for subclassname, count in dropped.get('subclasses', {}).items():
+        print(f"   ✂️ Dropped {count} points of subclass '{subclassname}' (max_points)")
+
+
+def resolve_points(
+    subclassname_cfg: Union[str, Callable],
+    rule: Dict[str, Any],
+    batch: List[Dict[str, Any]],
+    base_year: Optional[int],
+    include_msg: bool,
+    on_error: Dict[str, Callable[[Exception], None]]
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Build points of a batch of matches of one compiled rule."""
+    lines = [match['line_text'] for match in batch]
+    n = len(batch)
+    
+    # Resolve subclassname
+    subclassnames = resolve_batch(subclassname_cfg, lines, batch, ['Unnamed'] * n,
+                                  on_error['subclassname'], on_error['subclassname:batch'])
+    
+    # Resolve cursor
+    cursor_cfg = rule['cursor']
+    cursor_re = rule['cursor_re']
+    if callable(cursor_cfg):
+        cursors = resolve_batch(cursor_cfg, lines, batch,
+                                [f"L{match['line_number']}" for match in batch],
+                                on_error['cursor'], on_error['cursor:batch'])
+    elif cursor_cfg:
+        cursors = [cursor_cfg] * n
+    elif cursor_re:
+        cursor_prefix = rule['cursor_prefix']
+        cursors = []
+        for line_text, match in zip(lines, batch):
+            extracted = extract_cursor(line_text, cursor_re, '')
+            cursors.append(cursor_prefix + extracted if extracted else f"L{match['line_number']}")
+    else:
+        cursors = [f"L{match['line_number']}" for match in batch]
+    
+    # Resolve layer
+    layers = resolve_batch(rule['layer'], lines, batch, [1] * n,
+                           on_error['layer'], on_error['layer:batch'])
+    
+    for line_text, match, subclassname, cursor, layer in zip(lines, batch, subclassnames, cursors, layers):
+        point = {'cursor': str(cursor)}
+        if include_msg:
+            point['msg'] = line_text
+        point['line'] = match['line_number']
+        point['timestamp'] = parse_logcat_timestamp(line_text, base_year)
+        point['layer'] = int(layer)
+        yield subclassname, point
+
+
 def process_config(
     config: Dict[str, Any],
     log_file: str,
-    base_year: Optional[int] = None
+    base_year: Optional[int] = None,
+    include_msg: bool = True,
+    errors: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None,
+    dropped: Optional[Dict[str, Dict[str, int]]] = None
 ) -> Dict[str, Any]:
     """
     Process a single config file, return class data.
@@ -218,70 +837,32 @@ def process_config(
     - subclassname: string or function (line, match) -> str
     - cursor: string or function (line, match) -> str
     - layer: integer or function (line, match) -> int
+    Functions with `fn.vectorized = True` are called once per batch as
+    (lines, matches) -> list of results instead.
+    Rules and subclasses may set max_points (with sampling 'first',
+    'reservoir' or 'stratified'); dropped counts are recorded as
+    subclass 'dropped' and class 'dropped_rules'.
     
     Args:
         config: Configuration dictionary
         log_file: Log file path
         base_year: Base year for timestamp parsing
+        include_msg: Store matched line text in msg
+        errors: Filled with callable failure counts (see error_counter)
+        dropped: Filled with max_points drop counts (see iter_config_points)
     
     Returns:
         Class data in json2html format
     """
     classname = config.get('classname', 'Unnamed')
-    subclasses_config = config.get('subclasses', [])
     
-    subclass_points_map: Dict[str, List[Dict]] = defaultdict(list)
-    seen_lines: set = set()
+    if dropped is None:
+        dropped = {}
     
-    for sub_config in subclasses_config:
-        subclassname_cfg = sub_config.get('subclassname', 'Unnamed')
-        rules = sub_config.get('rules', [])
-        
-        for rule in rules:
-            pattern = rule.get('pattern', '')
-            if not pattern:
-                continue
-            
-            cursor_cfg = rule.get('cursor')
-            cursor_pattern = rule.get('cursor_pattern', '')
-            cursor_prefix = rule.get('cursor_prefix', '')
-            layer_cfg = rule.get('layer', 1)
-            
-            matches = run_rg_json(pattern, log_file)
-            
-            for match in matches:
-                line_num = match['line_number']
-                if line_num in seen_lines:
-                    continue
-                seen_lines.add(line_num)
-                
-                line_text = match['line_text']
-                timestamp = parse_logcat_timestamp(line_text, base_year)
-                
-                # Resolve subclassname
-                subclassname = resolve_callable(subclassname_cfg, line_text, match, 'Unnamed')
-                
-                # Resolve cursor
-                if callable(cursor_cfg):
-                    cursor = resolve_callable(cursor_cfg, line_text, match, f"L{line_num}")
-                elif cursor_cfg:
-                    cursor = cursor_cfg
-                elif cursor_pattern:
-                    extracted = extract_cursor(line_text, cursor_pattern, '')
-                    cursor = cursor_prefix + extracted if extracted else f"L{line_num}"
-                else:
-                    cursor = f"L{line_num}"
-                
-                # Resolve layer
-                layer = resolve_callable(layer_cfg, line_text, match, 1)
-                
-                subclass_points_map[subclassname].append({
-                    'cursor': str(cursor),
-                    'msg': line_text,
-                    'line': line_num,
-                    'timestamp': timestamp,
-                    'layer': int(layer)
-                })
+    subclass_points_map: Dict[str, List[Dict]] = defaultdict(list)
+    for subclassname, point in iter_config_points(config, log_file, base_year, include_msg,
+                                                  errors, dropped):
+        subclass_points_map[subclassname].append(point)
     
     # Build result
     result = {
@@ -297,9 +878,214 @@ def process_config(
                 'points': points
             })
     
+    add_dropped(result, dropped)
     return result
 
 
+def add_dropped(class_data: Dict[str, Any], dropped: Dict[str, Dict[str, int]]) -> None:
+    """
+    Record max_points drop counts in class data (only when non-zero).
+    
+    Subclasses whose points were all dropped are added without points so
+    their count is not lost.
+    """
+    subclass_dropped = dict(dropped.get('subclasses', {}))
+    for subclass in class_data['subclasses']:
+        count = subclass_dropped.pop(subclass['subclassname'], 0)
+        if count:
+            subclass['dropped'] = count
+    for subclassname, count in subclass_dropped.items():
+        if count:
+            class_data['subclasses'].append({'subclassname': subclassname, 'points': [], 'dropped': count})
+    if dropped.get('rules'):
+        class_data['dropped_rules'] = dict(dropped['rules'])
+
+
+class PointStore:
+    """
+    Points grouped by key with a memory budget.
+    
+    Points are kept in memory until their estimated size exceeds
+    max_memory, then every group is sorted by line and appended to a temp
+    file as one run. Reading a group k-way merges its runs with the
+    in-memory tail. When too many runs pile up they are merged into one so
+    open files stay bounded.
+    """
+    
+    # Rough per-point size of a dict with 5 keys and its values, in bytes
+    POINT_OVERHEAD = 350
+    # Points per pickled batch in a run
+    SPILL_BATCH = 1024
+    # Runs merged into one when exceeded
+    MAX_RUNS = 64
+    
+    def __init__(self, max_memory: int):
+        self.max_memory = max_memory
+        self.size = 0
+        self.spills = 0
+        self.counts: Dict[Any, int] = {}
+        self._points: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+        # [(file, {key: (offset, count)})]
+        self._runs: List[Tuple[IO, Dict[Any, Tuple[int, int]]]] = []
+    
+    def add(self, key: Any, point: Dict[str, Any]) -> None:
+        self._points[key].append(point)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.size += self.POINT_OVERHEAD + len(point['cursor']) + len(point.get('msg', ''))
+        if self.size > self.max_memory:
+            self.spill()
+    
+    def spill(self) -> None:
+        """Write in-memory points as a sorted run."""
+        if not self._points:
+            return
+        sorted_groups = []
+        for key, points in self._points.items():
+            points.sort(key=itemgetter('line'))
+            sorted_groups.append((key, points))
+        self._runs.append(self._write_run(sorted_groups))
+        self._points = defaultdict(list)
+        self.size = 0
+        self.spills += 1
+        
+        if len(self._runs) > self.MAX_RUNS:
+            runs = self._runs
+            self._runs = []
+            self._runs.append(self._write_run(
+                (key, heapq.merge(*self._run_iters(runs, key), key=itemgetter('line')))
+                for key in self.counts
+            ))
+            for f, _ in runs:
+                f.close()
+    
+    def _write_run(self, groups) -> Tuple[IO, Dict[Any, Tuple[int, int]]]:
+        f = tempfile.TemporaryFile(prefix='log2json_')
+        segments = {}
+        for key, points in groups:
+            offset = f.tell()
+            count = 0
+            batch = []
+            for point in points:
+                batch.append(point)
+                if len(batch) >= self.SPILL_BATCH:
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                count += len(batch)
+            if count:
+                segments[key] = (offset, count)
+        return f, segments
+    
+    @staticmethod
+    def _iter_segment(f: IO, offset: int, count: int) -> Iterator[Dict[str, Any]]:
+        while count > 0:
+            f.seek(offset)
+            batch = pickle.load(f)
+            offset = f.tell()
+            count -= len(batch)
+            yield from batch
+    
+    def _run_iters(self, runs, key: Any) -> List[Iterator[Dict[str, Any]]]:
+        return [self._iter_segment(f, *segments[key])
+                for f, segments in runs if key in segments]
+    
+    def iter_points(self, key: Any) -> Iterator[Dict[str, Any]]:
+        """Points of a group in line order."""
+        tail = self._points.get(key, [])
+        tail.sort(key=itemgetter('line'))
+        return heapq.merge(*self._run_iters(self._runs, key), tail, key=itemgetter('line'))
+    
+    def close(self) -> None:
+        for f, _ in self._runs:
+            f.close()
+        self._runs = []
+
+
+class StoredPoints:
+    """Points of one subclass held by a PointStore, iterated in line order."""
+    
+    def __init__(self, store: PointStore, key: Any):
+        self.store = store
+        self.key = key
+    
+    def __len__(self) -> int:
+        return self.store.counts.get(self.key, 0)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.store.iter_points(self.key)
+
+
+def store_config(
+    store: PointStore,
+    config: Dict[str, Any],
+    log_file: str,
+    base_year: Optional[int] = None,
+    include_msg: bool = True,
+    errors: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None,
+    dropped: Optional[Dict[str, Dict[str, int]]] = None
+) -> Dict[str, Any]:
+    """
+    Like process_config, but collect points into a PointStore.
+    
+    Returns:
+        Class data whose subclass points are StoredPoints
+    """
+    if dropped is None:
+        dropped = {}
+    
+    group = object()
+    subclassnames: Dict[str, None] = {}
+    for subclassname, point in iter_config_points(config, log_file, base_year, include_msg,
+                                                  errors, dropped):
+        subclassnames[subclassname] = None
+        store.add((group, subclassname), point)
+    
+    class_data = {
+        'classname': config.get('classname', 'Unnamed'),
+        'subclasses': [
+            {'subclassname': subclassname, 'points': StoredPoints(store, (group, subclassname))}
+            for subclassname in subclassnames
+        ]
+    }
+    add_dropped(class_data, dropped)
+    return class_data
+
+
+def _dump_extra_keys(data: Dict[str, Any], skip: Tuple[str, ...]) -> str:
+    """', "key": value' for keys of data not in skip."""
+    return ''.join(
+        ', ' + json.dumps(key) + ': ' + json.dumps(value, ensure_ascii=False)
+        for key, value in data.items() if key not in skip
+    )
+
+
+def dump_result_stream(result: Dict[str, Any], f: IO) -> None:
+    """
+    Write result JSON point by point.
+    
+    Subclass points may be any iterable (e.g. StoredPoints), so the full
+    result never has to be in memory.
+    """
+    f.write('{\n"name": ' + json.dumps(result['name'], ensure_ascii=False) + ',\n"all": [')
+    for ci, class_data in enumerate(result['all']):
+        f.write((',' if ci else '') + '\n{"classname": '
+                + json.dumps(class_data['classname'], ensure_ascii=False) + ', "subclasses": [')
+        for si, subclass in enumerate(class_data['subclasses']):
+            f.write((',' if si else '') + '\n{"subclassname": '
+                    + json.dumps(subclass['subclassname'], ensure_ascii=False) + ', "points": [')
+            for pi, point in enumerate(subclass['points']):
+                f.write((',\n' if pi else '\n') + json.dumps(point, ensure_ascii=False))
+            f.write('\n]' + _dump_extra_keys(subclass, ('subclassname', 'points')) + '}')
+        f.write('\n]' + _dump_extra_keys(class_data, ('classname', 'subclasses')) + '}')
+    f.write('\n]')
+    for key, value in result.items():
+        if key not in ('name', 'all'):
+            f.write(',\n' + json.dumps(key) + ': ' + json.dumps(value, ensure_ascii=False))
+    f.write('\n}\n')
+
+
 def merge_results(
     configs_data: List[Dict],
     log_file: str,
@@ -325,6 +1111,676 @@ def merge_results(
     }
 
 
+class LogExtractor:
+    """
+    In-process extraction API.
+    
+    Holds loaded and compiled configs so many logs can be processed without
+    re-importing configs or serializing results to disk. Errors are raised
+    as Log2JsonError subclasses instead of exiting. Failures of config
+    callables are counted in `errors` (see error_counter), matches dropped
+    by max_points in `dropped` (see iter_config_points). Both are replaced
+    with fresh dicts at the start of each iter_points / extract call, so
+    they hold the counts of the last log.
+    
+    Example:
+        extractor = LogExtractor(['qlcfg/audio.py', 'qlcfg/system.py'])
+        for point in extractor.iter_points('log/1.log'):
+            ...
+        result = extractor.extract('log/1.log')
+    """
+    
+    def __init__(
+        self,
+        configs: List[Union[str, Dict[str, Any]]],
+        base_year: Optional[int] = None,
+        include_msg: bool = True
+    ):
+        """
+        Args:
+            configs: Config file paths or dicts returned by load_config
+            base_year: Base year for timestamp parsing
+            include_msg: Store matched line text in msg
+        
+        Raises:
+            ConfigError: A config failed to load
+        """
+        self.configs: List[Dict[str, Any]] = [
+            compile_config(c if isinstance(c, dict) else load_config(c))
+            for c in configs
+        ]
+        
+        self.base_year = base_year
+        self.include_msg = include_msg
+        self.errors: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.dropped: Dict[str, Dict[str, int]] = {}
+    
+    def iter_points(self, log_file: str) -> Iterator[Dict[str, Any]]:
+        """
+        Stream matched points of all configs for a log.
+        
+        Points are yielded config by config, rule by rule as rg produces them
+        (not sorted). process_json callbacks are not applied.
+        
+        Args:
+            log_file: Log file path
+        
+        Yields:
+            Point dicts with classname, subclassname, cursor, msg, line,
+            timestamp, layer
+        
+        Raises:
+            RipgrepError: rg could not be run or failed
+        """
+        self.reset_stats()
+        for config in self.configs:
+            classname = config.get('classname', 'Unnamed')
+            for subclassname, point in iter_config_points(
+                    config, log_file, self.base_year, self.include_msg, self.errors, self.dropped):
+                yield {'classname': classname, 'subclassname': subclassname, **point}
+    
+    def reset_stats(self) -> None:
+        """Start new errors / dropped counts."""
+        self.errors = {}
+        self.dropped = {}
+    
+    def extract_class(self, config: Dict[str, Any], log_file: str) -> Dict[str, Any]:
+        """Class data of one config for a log (see process_config); adds to the current counts."""
+        dropped = {}
+        class_data = process_config(config, log_file, self.base_year, self.include_msg,
+                                    self.errors, dropped)
+        for kind, counts in dropped.items():
+            totals = self.dropped.setdefault(kind, {})
+            for key, count in counts.items():
+                totals[key] = totals.get(key, 0) + count
+        return class_data
+    
+    def extract(
+        self,
+        log_file: str,
+        name: Optional[str] = None,
+        line_index: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract a log into a result dict in the CLI's JSON format.
+        
+        Unlike the CLI, all points are kept in memory (there is no
+        --max-memory spill) and a failing process_json callback raises
+        instead of being skipped with a warning.
+        
+        Args:
+            log_file: Log file path
+            name: Output JSON name field
+            line_index: Write a line-offset index to this path and add the
+                        `source` block (CLI --line-index)
+        
+        Returns:
+            Complete JSON data in json2html format
+        
+        Raises:
+            RipgrepError: rg could not be run or failed
+            Log2JsonError: A process_json callback failed
+            OSError: The line index could not be written
+        """
+        self.reset_stats()
+        all_data = []
+        for config in self.configs:
+            class_data = self.extract_class(config, log_file)
+            if class_data['subclasses'] or class_data.get('dropped_rules'):
+                all_data.append(class_data)
+        
+        result = merge_results(all_data, log_file, name)
+        if line_index:
+            result['source'] = write_source_index(log_file, line_index)
+        
+        for config in self.configs:
+            process_fn = config.get('process_json')
+            if not process_fn:
+                continue
+            try:
+                result = process_fn(result)
+            except Exception as e:
+                raise Log2JsonError(
+                    f"process_json failed in {config.get('_path', config.get('classname'))}: {e}"
+                ) from e
+        
+        return result
+
+
+class TimeHistogram:
+    """
+    Event counts over fixed-width time buckets.
+    
+    Buckets live in fixed-size array('I') pages keyed by page number, so
+    logs spanning a wide time range (e.g. boot time 01-01 then real time)
+    stay sparse.
+    """
+    
+    PAGE_BITS = 12
+    PAGE_SIZE = 1 << PAGE_BITS
+    
+    def __init__(self, bucket_ms: int):
+        self.bucket_ms = bucket_ms
+        self.pages: Dict[int, array] = {}
+    
+    def add(self, timestamp: int) -> None:
+        bucket = timestamp // self.bucket_ms
+        page = self.pages.get(bucket >> self.PAGE_BITS)
+        if page is None:
+            page = self.pages[bucket >> self.PAGE_BITS] = array('I', bytes(4 * self.PAGE_SIZE))
+        page[bucket & (self.PAGE_SIZE - 1)] += 1
+    
+    def buckets(self) -> List[List[int]]:
+        """Non-empty buckets as [bucket_start_ms, count], in time order."""
+        result = []
+        for page_num in sorted(self.pages):
+            base = page_num << self.PAGE_BITS
+            for i, count in enumerate(self.pages[page_num]):
+                if count:
+                    result.append([(base + i) * self.bucket_ms, count])
+        return result
+
+
+class GapHistogram:
+    """
+    Log-bucketed histogram of time gaps between consecutive events.
+    
+    Gaps below 128 ms are counted exactly; larger gaps share 64 buckets per
+    power of two and are reported rounded down (under 1.6% relative error),
+    so memory stays bounded however many events a series has.
+    """
+    
+    SUB_BITS = 6
+    
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+    
+    def add(self, gap: int) -> None:
+        shift = gap.bit_length() - 1 - self.SUB_BITS
+        index = gap if shift <= 0 else (shift << self.SUB_BITS) + (gap >> shift)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+    
+    def value(self, index: int) -> int:
+        """Lower bound of a bucket in ms."""
+        if index < 2 << self.SUB_BITS:
+            return index
+        shift = (index >> self.SUB_BITS) - 1
+        return (index - (shift << self.SUB_BITS)) << shift
+    
+    def percentiles(self, ps: List[float]) -> Dict[str, int]:
+        """Nearest-rank percentiles, keyed 'p50', 'p99.9'..."""
+        ranks = sorted((min(self.total, max(1, int(-(-p * self.total // 100)))), f"p{p:g}")
+                       for p in ps)
+        result = {}
+        seen = 0
+        it = iter(ranks)
+        rank, key = next(it)
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while rank <= seen:
+                result[key] = self.value(index)
+                try:
+                    rank, key = next(it)
+                except StopIteration:
+                    return result
+        return result
+
+
+class TimestampRuns:
+    """
+    Timestamps grouped by key, read back per key in time order.
+    
+    Timestamps are buffered in array('q') per key until the buffers exceed
+    max_memory; then every buffer is sorted and appended to a temp file as
+    one run, the way PointStore spills points. Reading a key k-way merges
+    its runs block by block with the sorted in-memory tail. A key with too
+    many runs has them merged into one.
+    """
+    
+    # Budget when --max-memory is not given
+    DEFAULT_MEMORY = 64 << 20
+    # Per-timestamp cost: 8 bytes in the array plus a list slot and int while sorting
+    TIMESTAMP_COST = 48
+    # Timestamps read per block when merging runs
+    READ_BLOCK = 4096
+    # Runs of one key merged into one when exceeded
+    MAX_RUNS = 64
+    
+    def __init__(self, max_memory: Optional[int] = None):
+        self.max_memory = max_memory or self.DEFAULT_MEMORY
+        self.size = 0
+        self.spills = 0
+        self._buffers: Dict[Any, array] = {}
+        self._file: Optional[IO] = None
+        # key -> [(offset, count)] in self._file
+        self._runs: Dict[Any, List[Tuple[int, int]]] = defaultdict(list)
+    
+    def add(self, key: Any, timestamp: int) -> None:
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = array('q')
+        buffer.append(timestamp)
+        self.size += self.TIMESTAMP_COST
+        if self.size > self.max_memory:
+            self.spill()
+    
+    def spill(self) -> None:
+        """Write every buffer as a sorted run."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='log2json_')
+        for key, buffer in self._buffers.items():
+            self._runs[key].append(self._write_run(array('q', sorted(buffer))))
+            if len(self._runs[key]) > self.MAX_RUNS:
+                runs = self._runs[key]
+                self._runs[key] = [self._write_run(heapq.merge(*self._run_iters(runs)))]
+        self._buffers = {}
+        self.size = 0
+        self.spills += 1
+    
+    def _write_run(self, timestamps: Iterator[int]) -> Tuple[int, int]:
+        f = self._file
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        count = 0
+        block = array('q')
+        for timestamp in timestamps:
+            block.append(timestamp)
+            if len(block) >= self.READ_BLOCK:
+                # Merged inputs read from the same file, so seek back to the end
+                f.seek(offset + count * block.itemsize)
+                block.tofile(f)
+                count += len(block)
+                block = array('q')
+        f.seek(offset + count * block.itemsize)
+        block.tofile(f)
+        count += len(block)
+        return offset, count
+    
+    def _iter_run(self, offset: int, count: int) -> Iterator[int]:
+        while count > 0:
+            block = array('q')
+            self._file.seek(offset)
+            block.fromfile(self._file, min(count, self.READ_BLOCK))
+            offset += len(block) * block.itemsize
+            count -= len(block)
+            yield from block
+    
+    def _run_iters(self, runs: List[Tuple[int, int]]) -> List[Iterator[int]]:
+        return [self._iter_run(offset, count) for offset, count in runs]
+    
+    def iter_sorted(self, key: Any) -> Iterator[int]:
+        """Timestamps of a key in ascending order."""
+        tail = array('q', sorted(self._buffers.get(key, ())))
+        return heapq.merge(*self._run_iters(self._runs.get(key, [])), tail)
+    
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._runs.clear()
+
+
+class EventAggregator:
+    """
+    Streaming per-(classname, subclassname, layer) event rate aggregation.
+    
+    Points are counted into a TimeHistogram per series in one pass. For gap
+    percentiles the series timestamps go into TimestampRuns (bounded by
+    max_memory, spilling to disk); result() merges each series into time
+    order and feeds the gaps between consecutive events to a GapHistogram.
+    """
+    
+    def __init__(
+        self,
+        bucket_ms: int,
+        gap_percentiles: Optional[List[float]] = None,
+        max_memory: Optional[int] = None
+    ):
+        self.bucket_ms = bucket_ms
+        self.gap_percentiles = gap_percentiles or []
+        self.series: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+        self.timestamps = TimestampRuns(max_memory) if self.gap_percentiles else None
+    
+    def add(self, classname: str, subclassname: str, point: Dict[str, Any]) -> None:
+        key = (classname, subclassname, point['layer'])
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {
+                'total': 0,
+                'untimed': 0,
+                'histogram': TimeHistogram(self.bucket_ms)
+            }
+        
+        series['total'] += 1
+        timestamp = point['timestamp']
+        if not timestamp:
+            series['untimed'] += 1
+            return
+        series['histogram'].add(timestamp)
+        if self.timestamps is not None:
+            self.timestamps.add(key, timestamp)
+    
+    def gap_histogram(self, key: Tuple[str, str, int]) -> GapHistogram:
+        """Gaps between consecutive timed events of a series, in time order."""
+        gaps = GapHistogram()
+        previous = None
+        for timestamp in self.timestamps.iter_sorted(key):
+            if previous is not None:
+                gaps.add(timestamp - previous)
+            previous = timestamp
+        return gaps
+    
+    def result(self, name: str) -> Dict[str, Any]:
+        """Aggregated output JSON."""
+        all_series = []
+        for (classname, subclassname, layer), series in self.series.items():
+            item = {
+                'classname': classname,
+                'subclassname': subclassname,
+                'layer': layer,
+                'total': series['total'],
+                'untimed': series['untimed'],
+                'buckets': series['histogram'].buckets()
+            }
+            if self.timestamps is not None:
+                gaps = self.gap_histogram((classname, subclassname, layer))
+                item['gap_ms'] = gaps.percentiles(self.gap_percentiles) if gaps.total else None
+            all_series.append(item)
+        
+        if self.timestamps is not None:
+            self.timestamps.close()
+        
+        return {
+            'name': name,
+            'mode': 'aggregate',
+            'bucket_ms': self.bucket_ms,
+            'series': all_series
+        }
+
+
+def run_aggregate(
+    log_file: str,
+    config_files: List[str],
+    output_file: str,
+    name: Optional[str],
+    options: Dict[str, Any]
+) -> None:
+    """Aggregation mode of main: count events per time bucket and write them."""
+    aggregator = EventAggregator(options['aggregate'], options['gap_percentiles'],
+                                 options['max_memory'])
+    total_points = 0
+    
+    for config_file in config_files:
+        print(f"🔍 Processing: {config_file}")
+        try:
+            config = load_config(config_file)
+            classname = config.get('classname', 'Unnamed')
+            class_points = 0
+            errors = {}
+            for subclassname, point in iter_config_points(config, log_file, include_msg=False,
+                                                          errors=errors, sample=False):
+                aggregator.add(classname, subclassname, point)
+                class_points += 1
+        except Log2JsonError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        
+        print_callable_errors(errors)
+        if config.get('process_json'):
+            print("   ├─ process_json skipped in aggregate mode")
+        print(f"   ├─ Class: {classname}")
+        print(f"   └─ Points: {class_points}")
+        total_points += class_points
+    
+    print()
+    
+    if name is None:
+        name = f"Log Analysis - {Path(log_file).name}"
+    result = aggregator.result(name)
+    
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    
+    print(f"✅ Generated: {output_file}")
+    print(f"📊 Summary: {len(result['series'])} series, {total_points} points, "
+          f"{options['aggregate']} ms buckets")
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    line_index TEXT,
+    lines INTEGER
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    classname TEXT NOT NULL,
+    subclassname TEXT NOT NULL,
+    UNIQUE (classname, subclassname)
+);
+CREATE TABLE IF NOT EXISTS points (
+    log_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    cursor TEXT NOT NULL,
+    msg TEXT,
+    line INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    layer INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dropped (
+    log_id INTEGER NOT NULL,
+    classname TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (log_id, classname, kind, name)
+);
+CREATE INDEX IF NOT EXISTS points_log_time ON points (log_id, timestamp);
+CREATE INDEX IF NOT EXISTS points_time ON points (timestamp, log_id, line);
+CREATE INDEX IF NOT EXISTS points_category_time ON points (category_id, timestamp);
+CREATE INDEX IF NOT EXISTS points_cursor ON points (cursor);
+"""
+
+# Rows per executemany call
+SQLITE_BATCH = 50000
+
+
+class SqliteWriter:
+    """
+    Bulk writer of extracted points into a SQLite database.
+    
+    All rows of a log are inserted in one transaction with batched
+    executemany; a log already in the database (same path) is replaced.
+    """
+    
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._categories: Dict[Tuple[str, str], int] = {}
+    
+    def category_id(self, classname: str, subclassname: str) -> int:
+        key = (classname, subclassname)
+        category_id = self._categories.get(key)
+        if category_id is None:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO categories (classname, subclassname) VALUES (?, ?)', key)
+            category_id = self.conn.execute(
+                'SELECT id FROM categories WHERE classname = ? AND subclassname = ?', key
+            ).fetchone()[0]
+            self._categories[key] = category_id
+        return category_id
+    
+    def line_index_path(self, log_id: int) -> str:
+        """Line index sidecar of a stored log: <db stem>.<log id>.lineidx next to the db."""
+        db_path = Path(self.db_file)
+        return str(db_path.with_name(f"{db_path.stem}.{log_id}{LINE_INDEX_SUFFIX}"))
+    
+    def write_log(
+        self,
+        log_file: str,
+        name: str,
+        points: Iterator[Tuple[str, str, Dict[str, Any]]],
+        line_index: bool = False,
+        dropped: Optional[Dict[str, Dict[str, Dict[str, int]]]] = None
+    ) -> Tuple[int, int, Optional[Dict[str, Any]]]:
+        """
+        Insert all points of a log.
+        
+        Args:
+            log_file: Log file path
+            name: Display name of the log
+            points: (classname, subclassname, point) tuples
+            line_index: Also write the log's line index (see line_index_path)
+            dropped: classname -> max_points drop counts (see iter_config_points),
+                     read once points are exhausted and stored in the dropped
+                     table as kind 'rule' (name = pattern) or 'subclass'
+        
+        Returns:
+            (log id, number of points, line index info from write_source_index)
+        """
+        path = str(Path(log_file).absolute())
+        count = 0
+        source = None
+        stale_indexes = []
+        with self.conn:
+            for log_id, old_index in self.conn.execute(
+                    'SELECT id, line_index FROM logs WHERE path = ?', (path,)).fetchall():
+                self.conn.execute('DELETE FROM points WHERE log_id = ?', (log_id,))
+                self.conn.execute('DELETE FROM dropped WHERE log_id = ?', (log_id,))
+                self.conn.execute('DELETE FROM logs WHERE id = ?', (log_id,))
+                if old_index:
+                    stale_indexes.append(old_index)
+            
+            log_id = self.conn.execute(
+                'INSERT INTO logs (path, name, created) VALUES (?, ?, ?)',
+                (path, name, int(time.time()))
+            ).lastrowid
+            
+            insert = ('INSERT INTO points (log_id, category_id, cursor, msg, line, timestamp, layer) '
+                      'VALUES (?, ?, ?, ?, ?, ?, ?)')
+            rows = []
+            for classname, subclassname, point in points:
+                rows.append((log_id, self.category_id(classname, subclassname), point['cursor'],
+                             point.get('msg'), point['line'], point['timestamp'], point['layer']))
+                if len(rows) >= SQLITE_BATCH:
+                    self.conn.executemany(insert, rows)
+                    count += len(rows)
+                    rows = []
+            if rows:
+                self.conn.executemany(insert, rows)
+                count += len(rows)
+            
+            if dropped:
+                self.conn.executemany(
+                    'INSERT INTO dropped (log_id, classname, kind, name, count) VALUES (?, ?, ?, ?, ?)',
+                    [(log_id, classname, kind, name, n)
+                     for classname, counts in dropped.items()
+                     for kind, group in (('rule', counts.get('rules', {})),
+                                         ('subclass', counts.get('subclasses', {})))
+                     for name, n in group.items() if n])
+            
+            # Named by log id so logs with the same file name do not collide
+            if line_index:
+                source = write_source_index(log_file, self.line_index_path(log_id))
+                self.conn.execute('UPDATE logs SET line_index = ?, lines = ? WHERE id = ?',
+                                  (source['line_index'], source['lines'], log_id))
+        
+        for old_index in stale_indexes:
+            if old_index != (source and source['line_index']):
+                try:
+                    os.remove(old_index)
+                except OSError:
+                    pass
+        
+        return log_id, count, source
+    
+    def close(self) -> None:
+        self.conn.close()
+
+
+def run_sqlite(
+    log_file: str,
+    config_files: List[str],
+    name: Optional[str],
+    options: Dict[str, Any]
+) -> None:
+    """SQLite mode of main: stream points of all configs into the database."""
+    db_file = options['sqlite']
+    if name is None:
+        name = Path(log_file).name
+    
+    configs = []
+    try:
+        for config_file in config_files:
+            configs.append(load_config(config_file))
+    except Log2JsonError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    for config_file, config in zip(config_files, configs):
+        if config.get('process_json'):
+            print(f"⚠️ process_json skipped in {config_file}: not supported with --sqlite")
+    
+    all_dropped: Dict[str, Dict[str, Dict[str, int]]] = {}
+    
+    def iter_all_points():
+        for config_file, config in zip(config_files, configs):
+            print(f"🔍 Processing: {config_file}")
+            classname = config.get('classname', 'Unnamed')
+            errors = {}
+            dropped = {}
+            for subclassname, point in iter_config_points(
+                    config, log_file, include_msg=options['include_msg'], errors=errors, dropped=dropped):
+                yield classname, subclassname, point
+            print_callable_errors(errors)
+            print_dropped(dropped)
+            
+            class_dropped = all_dropped.setdefault(classname, {})
+            for kind, counts in dropped.items():
+                totals = class_dropped.setdefault(kind, {})
+                for key, n in counts.items():
+                    totals[key] = totals.get(key, 0) + n
+    
+    writer = SqliteWriter(db_file)
+    try:
+        log_id, total_points, source = writer.write_log(
+            log_file, name, iter_all_points(), options['line_index'], all_dropped)
+    except Log2JsonError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        writer.close()
+    
+    print()
+    if source:
+        print(f"🗂️ Line index: {source['line_index']} ({source['lines']} lines)")
+    print(f"✅ Generated: {db_file} (log id {log_id})")
+    print(f"📊 Summary: {total_points} points")
+
+
+def parse_size(value: str) -> int:
+    """Parse size like '512M', '2G', '800K' or '512' (MB) to bytes, 0 if invalid."""
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    value = value.strip().upper().rstrip('B')
+    unit = units['M']
+    if value and value[-1] in units:
+        unit = units[value[-1]]
+        value = value[:-1]
+    try:
+        size = int(float(value) * unit)
+    except ValueError:
+        return 0
+    return max(size, 0)
+
+
 def parse_args(argv: List[str]) -> tuple:
     """Parse command line arguments."""
     if len(argv) < 3:
@@ -335,6 +1791,14 @@ def parse_args(argv: List[str]) -> tuple:
     config_files = []
     output_file = None
     name = None
+    options = {
+        'line_index': False,
+        'include_msg': True,
+        'max_memory': None,
+        'aggregate': None,
+        'gap_percentiles': None,
+        'sqlite': None
+    }
     
     i = 2
     while i < len(argv):
@@ -345,11 +1809,45 @@ def parse_args(argv: List[str]) -> tuple:
         elif arg == '-n' and i + 1 < len(argv):
             name = argv[i + 1]
             i += 2
+        elif arg == '--line-index':
+            options['line_index'] = True
+            i += 1
+        elif arg == '--no-msg':
+            options['include_msg'] = False
+            options['line_index'] = True
+            i += 1
+        elif arg == '--max-memory' and i + 1 < len(argv):
+            options['max_memory'] = parse_size(argv[i + 1])
+            if not options['max_memory']:
+                print(f"❌ Invalid size for --max-memory: {argv[i + 1]}")
+                sys.exit(1)
+            i += 2
+        elif arg == '--aggregate' and i + 1 < len(argv):
+            try:
+                options['aggregate'] = int(argv[i + 1])
+            except ValueError:
+                options['aggregate'] = 0
+            if options['aggregate'] <= 0:
+                print(f"❌ Invalid bucket size for --aggregate: {argv[i + 1]}")
+                sys.exit(1)
+            i += 2
+        elif arg == '--sqlite' and i + 1 < len(argv):
+            options['sqlite'] = argv[i + 1]
+            i += 2
+        elif arg == '--gap-percentiles' and i + 1 < len(argv):
+            try:
+                options['gap_percentiles'] = [float(p) for p in argv[i + 1].split(',')]
+            except ValueError:
+                options['gap_percentiles'] = []
+            if not options['gap_percentiles'] or not all(0 < p <= 100 for p in options['gap_percentiles']):
+                print(f"❌ Invalid percentiles for --gap-percentiles: {argv[i + 1]}")
+                sys.exit(1)
+            i += 2
         else:
             config_files.append(arg)
             i += 1
     
-    return log_file, config_files, output_file, name
+    return log_file, config_files, output_file, name, options
 
 
 def expand_config_patterns(patterns: List[str]) -> List[str]:
@@ -369,7 +1867,13 @@ def expand_config_patterns(patterns: List[str]) -> List[str]:
 
 def main():
     """Main entry point."""
-    log_file, config_files, output_file, name = parse_args(sys.argv)
+    # Fix Windows console encoding (here, not at import: library users keep their streams)
+    if sys.platform == 'win32':
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+    
+    log_file, config_files, output_file, name, options = parse_args(sys.argv)
     
     # Validate log file
     if not Path(log_file).exists():
@@ -393,18 +1897,41 @@ def main():
     
     print(f"📖 Log file: {log_file}")
     print(f"📋 Config files: {', '.join(config_files)}")
-    print(f"📝 Output file: {output_file}")
+    print(f"📝 Output file: {options['sqlite'] or output_file}")
     print()
     
+    if options['sqlite']:
+        run_sqlite(log_file, config_files, name, options)
+        return
+    
+    if options['aggregate']:
+        run_aggregate(log_file, config_files, output_file, name, options)
+        return
+    
     # Process each config
     all_data = []
     total_points = 0
     process_json_callbacks = []
+    store = PointStore(options['max_memory']) if options['max_memory'] else None
 
     for config_file in config_files:
         print(f"🔍 Processing: {config_file}")
-        config = load_config(config_file)
-        class_data = process_config(config, log_file)
+        try:
+            config = load_config(config_file)
+            errors = {}
+            dropped = {}
+            if store is None:
+                class_data = process_config(config, log_file, include_msg=options['include_msg'],
+                                            errors=errors, dropped=dropped)
+            else:
+                class_data = store_config(store, config, log_file, include_msg=options['include_msg'],
+                                          errors=errors, dropped=dropped)
+        except Log2JsonError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        
+        print_callable_errors(errors)
+        print_dropped(dropped)
         
         # Collect process_json callbacks
         if config.get('process_json'):
@@ -415,7 +1942,7 @@ def main():
         print(f"   ├─ Subclasses: {len(class_data['subclasses'])}")
         print(f"   └─ Points: {class_points}")
         
-        if class_data['subclasses']:
+        if class_data['subclasses'] or class_data.get('dropped_rules'):
             all_data.append(class_data)
             total_points += class_points
     
@@ -424,16 +1951,42 @@ def main():
     # Merge and write results
     result = merge_results(all_data, log_file, name)
     
-    # Call process_json callbacks from each config
-    for config_file, process_fn in process_json_callbacks:
+    # Line index sidecar for raw log context
+    if options['line_index']:
+        # serve.py finds <log>.lineidx without being told; the log's own
+        # suffix is kept so logcat.1 / logcat.2 or main.log / main.txt differ
+        index_file = str(log_file) + LINE_INDEX_SUFFIX
         try:
-            print(f"🔧 Running process_json from: {config_file}")
-            result = process_fn(result)
-        except Exception as e:
-            print(f"⚠️ process_json failed in {config_file}: {e}")
+            result['source'] = write_source_index(log_file, index_file)
+        except OSError:
+            index_file = str(output_file) + LINE_INDEX_SUFFIX
+            result['source'] = write_source_index(log_file, index_file)
+        print(f"🗂️ Line index: {index_file} ({result['source']['lines']} lines)")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    if store is not None and store.spills:
+        # Points do not fit in memory: merge spilled runs straight into the output
+        print(f"💾 Spilled {store.spills} runs to disk, merging")
+        for config_file, _ in process_json_callbacks:
+            print(f"⚠️ process_json skipped in {config_file}: result exceeds --max-memory")
+        with open(output_file, 'w', encoding='utf-8') as f:
+            dump_result_stream(result, f)
+        store.close()
+    else:
+        if store is not None:
+            for class_data in all_data:
+                for subclass in class_data['subclasses']:
+                    subclass['points'] = list(subclass['points'])
+        
+        # Call process_json callbacks from each config
+        for config_file, process_fn in process_json_callbacks:
+            try:
+                print(f"🔧 Running process_json from: {config_file}")
+                result = process_fn(result)
+            except Exception as e:
+                print(f"⚠️ process_json failed in {config_file}: {e}")
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
     
     subclass_count = sum(len(c['subclasses']) for c in all_data)
     print(f"✅ Generated: {output_file}")
@@ -9,6 +9,11 @@ Config file structure:
         - pattern: ripgrep regex pattern
         - cursor: string or function (line, match) -> str
         - layer: integer or function (line, match) -> int
+        - max_points (optional): keep at most N points of the rule
+        - sampling (optional): 'first' (default), 'reservoir' or 'stratified'
+    - max_points / sampling (optional): same, per subclass
+    Functions may set `fn.vectorized = True` to be called once per batch as
+    (lines, matches) -> list of results (see qlcfg/system.py)
 """
 
 import re
@@ -114,7 +119,11 @@ subclasses = [
                 "pattern": "AudioFlinger.*start|stop",
                 "cursor": "AUDIO_FLINGER",
                 # Use lambda to dynamically generate layer: Error=1, Warning=2, Other=3
-                "layer": lambda line, match: 1 if ' E ' in line else (2 if ' W ' in line else 3)
+                "layer": lambda line, match: 1 if ' E ' in line else (2 if ' W ' in line else 3),
+                # "stop" alone matches any line containing it: cap the points,
+                # spread evenly over the log's time range
+                "max_points": 5000,
+                "sampling": "stratified"
             },
             {
                 "pattern": "AudioPolicy.*output",
@@ -21,6 +21,23 @@ def extract_property_name(line, match=None):
     return "AVC_UNKNOWN"
 
 
+PROPERTY_RE = re.compile(r'property=([^\s]+)')
+NON_WORD_RE = re.compile(r'[^\w]')
+
+
+def extract_property_names(lines, matches=None):
+    """Batch version of extract_property_name, called once per batch of lines."""
+    cursors = []
+    for line in lines:
+        m = PROPERTY_RE.search(line)
+        cursors.append(f"AVC_{NON_WORD_RE.sub('_', m.group(1))}" if m else "AVC_UNKNOWN")
+    return cursors
+
+
+# Vectorized: receives (lines, matches) lists and returns a list of cursors
+extract_property_names.vectorized = True
+
+
 def extract_audit_type(line, match=None):
     """Extract type from audit log."""
     m = re.search(r'type=(\d+)', line)
@@ -65,7 +82,8 @@ subclasses = [
             },
             {
                 "pattern": "avc.*denied.*property=",
-                "cursor": extract_property_name,
+                # Many hits: use the vectorized version to avoid per-line calls
+                "cursor": extract_property_names,
                 "layer": 2
             },
             {
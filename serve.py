@@ -2,25 +2,648 @@
 """
 Simple HTTP server for Quick Log production build.
 Serves dist folder and any JSON file via /file/ path.
+
+Endpoints:
+    /file/<path>                      Serve any file by absolute path
+    /lines/<log path>?start=&end=     Return raw log lines start..end (inclusive)
+    /lines/<log path>?line=&context=  Return raw log lines around a line
+        Optional index=<path> points to the .lineidx sidecar written by
+        log2json.py (409 if it does not match the log); without it
+        <log>.lineidx is used if valid, else the index is built once and
+        kept in memory.
+    /search/<json path>?q=&after=&next=&limit=
+        Full-text token search over the points of an extracted result file.
+        Returns up to limit matching point ids (file order: class ->
+        subclass -> point) with their timestamps in ms, sorted by time, and
+        more=true if further matches exist. after=<ms> returns only matches
+        later than that time (jump to next match). The response's next is a
+        cursor; pass it back as next= to get the following page without
+        skipping matches that share a millisecond.
+    /sqlite/<db path>?q=logs
+        Logs stored in a database written by log2json.py --sqlite.
+    /sqlite/<db path>?log=&t0=&t1=&classname=&subclassname=&layer=&limit=
+        Points in a time window / category filter, in the viewer's JSON
+        format. log, classname, subclassname and layer may repeat; without
+        log all logs are queried and classnames are prefixed by
+        '#<log id> <log name>'.
 """
 
+import bisect
 import http.server
 import socketserver
+import json
+import mmap
 import os
+import re
+import sqlite3
+import struct
 import sys
 import urllib.parse
+from array import array
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+from log2json import build_line_index, LINE_INDEX_SUFFIX
 
 PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
 SCRIPT_DIR = Path(__file__).parent.absolute()
 DIST_DIR = SCRIPT_DIR / "dist"
 
+# Max lines returned by a single /lines/ request
+MAX_LINES = 10000
+
+# Default / max matches returned by a single /search/ request
+SEARCH_LIMIT = 1000
+MAX_SEARCH_LIMIT = 100000
+
+# Default / max points returned by a single /sqlite/ request
+SQLITE_LIMIT = 100000
+MAX_SQLITE_LIMIT = 1000000
+
+SEARCH_INDEX_SUFFIX = '.searchidx'
+SEARCH_INDEX_VERSION = 2
+SEARCH_INDEX_MAGIC = b'QLSI'
+TOKEN_RE = re.compile(r'\w+')
+
+# In-memory line indexes for logs without a sidecar: path -> (mtime, size, offsets)
+_line_index_cache = {}
+
+# Loaded search indexes: json path -> SearchIndex
+_search_index_cache = {}
+
+
+def resolve_path(path_str: str) -> Path:
+    """Convert URL path part to a local path (handles UNC //server/share)."""
+    path_str = urllib.parse.unquote(path_str)
+    if path_str.startswith('//'):
+        path_str = path_str.replace('/', '\\')
+    return Path(path_str)
+
+
+class StaleLineIndexError(ValueError):
+    """Line index sidecar is malformed or does not match its log."""
+
+
+class LineIndex:
+    """
+    Line offset lookup over a .lineidx sidecar (mmap) or an in-memory array.
+    
+    A sidecar must hold at least two offsets and end with the log's size.
+    An explicitly given sidecar that fails this raises StaleLineIndexError;
+    a discovered <log>.lineidx that fails it is ignored.
+    """
+    
+    def __init__(self, log_path: Path, index_path: Path = None):
+        self._mm = None
+        self._file = None
+        self._offsets = None
+        
+        explicit = index_path is not None
+        if index_path is None:
+            candidate = log_path.with_name(log_path.name + LINE_INDEX_SUFFIX)
+            if candidate.is_file():
+                index_path = candidate
+        
+        if index_path is not None:
+            try:
+                self._open_sidecar(log_path, index_path)
+                return
+            except StaleLineIndexError:
+                if explicit:
+                    raise
+        
+        self._offsets = self._cached_offsets(log_path)
+        self.count = len(self._offsets) - 1
+    
+    def _open_sidecar(self, log_path: Path, index_path: Path):
+        size = index_path.stat().st_size
+        if size < 16 or size % 8:
+            raise StaleLineIndexError(f"Malformed line index: {index_path}")
+        
+        self._file = open(index_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if struct.unpack_from('<Q', self._mm, size - 8)[0] != log_path.stat().st_size:
+            self.close()
+            raise StaleLineIndexError(f"Line index {index_path} does not match {log_path}")
+        self.count = size // 8 - 1
+    
+    @staticmethod
+    def _cached_offsets(log_path: Path):
+        stat = log_path.stat()
+        key = str(log_path.absolute())
+        cached = _line_index_cache.get(key)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        offsets = build_line_index(str(log_path))
+        _line_index_cache[key] = (stat.st_mtime, stat.st_size, offsets)
+        return offsets
+    
+    def offset(self, i: int) -> int:
+        """Byte offset where 1-based line i + 1 starts."""
+        if self._mm is not None:
+            return struct.unpack_from('<Q', self._mm, i * 8)[0]
+        return self._offsets[i]
+    
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+
+def read_log_lines(log_path: Path, index: LineIndex, start: int, end: int) -> list:
+    """Read 1-based inclusive line range from log via mmap."""
+    start = max(1, start)
+    end = min(index.count, end, start + MAX_LINES - 1)
+    if end < start:
+        return []
+    
+    begin = index.offset(start - 1)
+    stop = index.offset(end)
+    if stop <= begin:
+        return [''] * (end - start + 1)
+    
+    with open(log_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[begin:stop]
+    
+    text = data.decode('utf-8', errors='replace')
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return [line.rstrip('\r') for line in lines]
+
+
+class SearchIndex:
+    """
+    Token inverted index over the points of an extracted result JSON.
+    
+    Points are stored in time order (timestamp, then file order); ids maps
+    each time-ordered position back to the point's ordinal in file order
+    (class -> subclass -> point). Postings hold sorted positions, so a
+    query is a sorted merge that starts at bisect(after) and stops at limit.
+    Tokens are lowercased word runs of msg and cursor. When points have no
+    msg (log2json --no-msg) the text is read from the source log.
+    
+    The index is cached on disk as <json>.searchidx (JSON header followed by
+    raw arrays) and rebuilt when the JSON's mtime or size changes.
+    """
+    
+    def __init__(self, mtime: float, size: int, ids, timestamps, lines, postings: dict):
+        self.mtime = mtime
+        self.size = size
+        self.ids = ids
+        self.timestamps = timestamps
+        self.lines = lines
+        self.postings = postings
+    
+    @classmethod
+    def load(cls, json_path: Path) -> 'SearchIndex':
+        """Load index from memory / disk cache, building it if stale."""
+        stat = json_path.stat()
+        key = str(json_path.absolute())
+        
+        index = _search_index_cache.get(key)
+        if index and index.mtime == stat.st_mtime and index.size == stat.st_size:
+            return index
+        
+        cache_path = json_path.with_suffix(SEARCH_INDEX_SUFFIX)
+        index = cls._read_cache(cache_path, stat)
+        if index is None:
+            index = cls.build(json_path, stat)
+            try:
+                index._write_cache(cache_path)
+            except OSError as e:
+                print(f"Warning: cannot write search index {cache_path}: {e}")
+        
+        _search_index_cache[key] = index
+        return index
+    
+    @classmethod
+    def build(cls, json_path: Path, stat: os.stat_result) -> 'SearchIndex':
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        timestamps = array('q')
+        lines = array('q')
+        postings = {}
+        
+        line_text = _source_line_reader(data.get('source'))
+        try:
+            point_id = 0
+            for class_data in data.get('all', []):
+                for subclass in class_data.get('subclasses', []):
+                    for point in subclass.get('points', []):
+                        line = point.get('line', 0)
+                        msg = point.get('msg')
+                        if msg is None and line_text:
+                            msg = line_text(line)
+                        text = f"{msg or ''} {point.get('cursor', '')}".lower()
+                        
+                        for token in set(TOKEN_RE.findall(text)):
+                            ids = postings.get(token)
+                            if ids is None:
+                                ids = postings[token] = array('I')
+                            ids.append(point_id)
+                        
+                        timestamps.append(point.get('timestamp', 0))
+                        lines.append(line)
+                        point_id += 1
+        finally:
+            if line_text:
+                line_text.close()
+        del data
+        
+        # Renumber points by time; sort is stable so ties keep file order
+        order = array('I', sorted(range(len(timestamps)), key=timestamps.__getitem__))
+        rank = array('I', [0]) * len(order)
+        for pos, i in enumerate(order):
+            rank[i] = pos
+        for token, ids in postings.items():
+            postings[token] = array('I', sorted(rank[i] for i in ids))
+        
+        return cls(stat.st_mtime, stat.st_size, order,
+                   array('q', (timestamps[i] for i in order)),
+                   array('q', (lines[i] for i in order)),
+                   postings)
+    
+    @classmethod
+    def _read_cache(cls, cache_path: Path, stat: os.stat_result) -> Optional['SearchIndex']:
+        """Read a cache file; None if missing, malformed or stale."""
+        if not cache_path.is_file():
+            return None
+        try:
+            file_size = cache_path.stat().st_size
+            with open(cache_path, 'rb') as f:
+                magic, header_len = struct.unpack('<4sI', f.read(8))
+                if magic != SEARCH_INDEX_MAGIC or header_len > file_size - 8:
+                    return None
+                header = json.loads(f.read(header_len).decode('utf-8'))
+                if (header.get('version') != SEARCH_INDEX_VERSION
+                        or header.get('byteorder') != sys.byteorder
+                        or header.get('mtime') != stat.st_mtime
+                        or header.get('size') != stat.st_size):
+                    return None
+                
+                count = header['count']
+                tokens = header['tokens']
+                total = sum(n for _, n in tokens)
+                ids, timestamps, lines, flat = array('I'), array('q'), array('q'), array('I')
+                expected = (8 + header_len + count * (ids.itemsize + timestamps.itemsize
+                                                      + lines.itemsize)
+                            + total * flat.itemsize)
+                if expected != file_size:
+                    return None
+                ids.fromfile(f, count)
+                timestamps.fromfile(f, count)
+                lines.fromfile(f, count)
+                flat.fromfile(f, total)
+        except (OSError, EOFError, ValueError, KeyError, TypeError, struct.error):
+            return None
+        
+        postings = {}
+        view = memoryview(flat)
+        offset = 0
+        for token, n in tokens:
+            postings[token] = view[offset:offset + n]
+            offset += n
+        return cls(stat.st_mtime, stat.st_size, ids, timestamps, lines, postings)
+    
+    def _write_cache(self, cache_path: Path):
+        header = json.dumps({
+            'version': SEARCH_INDEX_VERSION,
+            'byteorder': sys.byteorder,
+            'mtime': self.mtime,
+            'size': self.size,
+            'count': len(self.ids),
+            'tokens': [[token, len(ids)] for token, ids in self.postings.items()]
+        }, ensure_ascii=False).encode('utf-8')
+        with open(cache_path, 'wb') as f:
+            f.write(struct.pack('<4sI', SEARCH_INDEX_MAGIC, len(header)))
+            f.write(header)
+            array('I', self.ids).tofile(f)
+            array('q', self.timestamps).tofile(f)
+            array('q', self.lines).tofile(f)
+            for ids in self.postings.values():
+                f.write(ids)
+    
+    def search(self, query: str, after: Optional[int] = None,
+               limit: int = SEARCH_LIMIT, start: Optional[int] = None) -> Tuple[List[int], bool]:
+        """
+        Return time-ordered positions of points containing all query tokens,
+        at or after position start (else later than after, in ms), at most
+        limit of them, and whether more match.
+        """
+        tokens = set(TOKEN_RE.findall(query.lower()))
+        if not tokens:
+            return [], False
+        
+        lists = []
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                return [], False
+            lists.append(ids)
+        lists.sort(key=len)
+        
+        if start is None:
+            start = 0 if after is None else bisect.bisect_right(self.timestamps, after)
+        driver, others = lists[0], lists[1:]
+        cursors = [bisect.bisect_left(ids, start) for ids in others]
+        
+        result = []
+        for k in range(bisect.bisect_left(driver, start), len(driver)):
+            pos = driver[k]
+            for j, ids in enumerate(others):
+                c = bisect.bisect_left(ids, pos, cursors[j])
+                cursors[j] = c
+                if c == len(ids):
+                    return result, False
+                if ids[c] != pos:
+                    break
+            else:
+                if len(result) == limit:
+                    return result, True
+                result.append(pos)
+        return result, False
+
+
+class _SourceLineReader:
+    """Read single lines of the source log via its line index and mmap."""
+    
+    def __init__(self, log_path: Path, index: LineIndex):
+        self._index = index
+        self._file = open(log_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def __call__(self, line: int) -> str:
+        if line < 1 or line > self._index.count:
+            return ''
+        data = self._mm[self._index.offset(line - 1):self._index.offset(line)]
+        return data.decode('utf-8', errors='replace').rstrip('\r\n')
+    
+    def close(self):
+        self._mm.close()
+        self._file.close()
+        self._index.close()
+
+
+def _source_line_reader(source: Optional[dict]) -> Optional[_SourceLineReader]:
+    """Line reader for the log a result JSON was extracted from, if available."""
+    if not source:
+        return None
+    log_path = Path(source.get('log', ''))
+    if not log_path.is_file() or log_path.stat().st_size == 0:
+        return None
+    index_path = Path(source.get('line_index', ''))
+    try:
+        index = LineIndex(log_path, index_path if index_path.is_file() else None)
+    except StaleLineIndexError:
+        index = LineIndex(log_path)
+    return _SourceLineReader(log_path, index)
+
+
+def open_db(db_path: Path) -> sqlite3.Connection:
+    """Open a log2json SQLite database read-only."""
+    return sqlite3.connect(db_path.absolute().as_uri() + '?mode=ro', uri=True)
+
+
+def query_db_logs(conn: sqlite3.Connection) -> list:
+    """Logs in the database with their point counts."""
+    rows = conn.execute(
+        'SELECT l.id, l.name, l.path, l.created, l.line_index, l.lines, '
+        '(SELECT COUNT(*) FROM points p WHERE p.log_id = l.id) '
+        'FROM logs l ORDER BY l.id'
+    ).fetchall()
+    return [
+        {'id': r[0], 'name': r[1], 'path': r[2], 'created': r[3],
+         'line_index': r[4], 'lines': r[5], 'points': r[6]}
+        for r in rows
+    ]
+
+
+def query_db_points(conn: sqlite3.Connection, query: dict) -> dict:
+    """
+    Points matching a window / category filter, grouped like a result JSON.
+    
+    Raises:
+        ValueError: Invalid numeric parameter
+    """
+    where = []
+    params = []
+    
+    log_ids = [int(v) for v in query.get('log', [])]
+    if log_ids:
+        where.append(f"p.log_id IN ({','.join('?' * len(log_ids))})")
+        params.extend(log_ids)
+    if 't0' in query:
+        where.append('p.timestamp >= ?')
+        params.append(int(query['t0'][0]))
+    if 't1' in query:
+        where.append('p.timestamp <= ?')
+        params.append(int(query['t1'][0]))
+    for field in ('classname', 'subclassname'):
+        values = query.get(field, [])
+        if values:
+            where.append(f"c.{field} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    layers = [int(v) for v in query.get('layer', [])]
+    if layers:
+        where.append(f"p.layer IN ({','.join('?' * len(layers))})")
+        params.extend(layers)
+    
+    limit = max(1, min(int(query.get('limit', [str(SQLITE_LIMIT)])[0]), MAX_SQLITE_LIMIT))
+    
+    sql = ('SELECT p.log_id, l.name, c.classname, c.subclassname, '
+           'p.cursor, p.msg, p.line, p.timestamp, p.layer '
+           'FROM points p JOIN categories c ON c.id = p.category_id '
+           'JOIN logs l ON l.id = p.log_id')
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY p.timestamp, p.log_id, p.line LIMIT ?'
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    
+    if log_ids:
+        prefix_log = len(log_ids) > 1
+    else:
+        prefix_log = conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0] > 1
+    
+    classes = {}
+    for log_id, log_name, classname, subclassname, cursor, msg, line, timestamp, layer in rows:
+        if prefix_log:
+            # Log names default to the file name and may repeat across devices
+            classname = f"#{log_id} {log_name}: {classname}"
+        subclasses = classes.setdefault(classname, {})
+        point = {'cursor': cursor}
+        if msg is not None:
+            point['msg'] = msg
+        point['line'] = line
+        point['timestamp'] = timestamp
+        point['layer'] = layer
+        subclasses.setdefault(subclassname, []).append(point)
+    
+    return {
+        'name': 'SQLite Query',
+        'all': [
+            {
+                'classname': classname,
+                'subclasses': [
+                    {'subclassname': subclassname, 'points': points}
+                    for subclassname, points in subclasses.items()
+                ]
+            }
+            for classname, subclasses in classes.items()
+        ],
+        'truncated': truncated
+    }
+
 
 class QLHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(DIST_DIR), **kwargs)
     
+    def send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_lines(self, path_part: str, query: dict):
+        """Return a range of raw log lines: /lines/<log path>?start=&end="""
+        log_path = resolve_path(path_part)
+        if not log_path.is_file():
+            self.send_error(404, f"File not found: {log_path}")
+            return
+        
+        index_path = None
+        if 'index' in query:
+            index_path = resolve_path(query['index'][0])
+            if not index_path.is_file():
+                self.send_error(404, f"Line index not found: {index_path}")
+                return
+        
+        try:
+            if 'line' in query:
+                line = int(query['line'][0])
+                context = int(query.get('context', ['0'])[0])
+                start, end = line - context, line + context
+            else:
+                start = int(query.get('start', ['1'])[0])
+                end = int(query.get('end', [str(start)])[0])
+        except ValueError:
+            self.send_error(400, "Invalid line range")
+            return
+        
+        try:
+            index = LineIndex(log_path, index_path)
+        except StaleLineIndexError as e:
+            self.send_error(409, str(e))
+            return
+        try:
+            lines = read_log_lines(log_path, index, start, end)
+            total = index.count
+        finally:
+            index.close()
+        
+        start = max(1, start)
+        self.send_json({
+            'start': start,
+            'end': start + len(lines) - 1,
+            'total': total,
+            'lines': lines
+        })
+    
+    def handle_search(self, path_part: str, query: dict):
+        """Token search over extracted points: /search/<json path>?q="""
+        json_path = resolve_path(path_part)
+        if not json_path.is_file():
+            self.send_error(404, f"File not found: {json_path}")
+            return
+        
+        q = query.get('q', [''])[0]
+        try:
+            after = int(query['after'][0]) if 'after' in query else None
+            start = int(query['next'][0]) if 'next' in query else None
+            limit = int(query.get('limit', [str(SEARCH_LIMIT)])[0])
+            if start is not None and start < 0:
+                raise ValueError(start)
+        except ValueError:
+            self.send_error(400, "Invalid search parameters")
+            return
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        
+        try:
+            index = SearchIndex.load(json_path)
+        except (OSError, ValueError) as e:
+            self.send_error(500, f"Cannot index {json_path}: {e}")
+            return
+        
+        positions, more = index.search(q, after, limit, start)
+        
+        self.send_json({
+            'query': q,
+            'more': more,
+            'next': positions[-1] + 1 if more else None,
+            'ids': [index.ids[p] for p in positions],
+            'timestamps': [index.timestamps[p] for p in positions],
+            'lines': [index.lines[p] for p in positions]
+        })
+    
+    def handle_sqlite(self, path_part: str, query: dict):
+        """Window / filter queries on a log2json --sqlite database."""
+        db_path = resolve_path(path_part)
+        if not db_path.is_file():
+            self.send_error(404, f"File not found: {db_path}")
+            return
+        
+        try:
+            conn = open_db(db_path)
+        except sqlite3.Error as e:
+            self.send_error(500, f"Cannot open database {db_path}: {e}")
+            return
+        
+        try:
+            if query.get('q', ['points'])[0] == 'logs':
+                data = query_db_logs(conn)
+            else:
+                data = query_db_points(conn, query)
+        except ValueError:
+            self.send_error(400, "Invalid query parameters")
+            return
+        except sqlite3.Error as e:
+            self.send_error(500, f"Query failed: {e}")
+            return
+        finally:
+            conn.close()
+        
+        self.send_json(data)
+    
     def do_GET(self):
+        # Handle /lines/* requests - raw log context by line range
+        if self.path.startswith('/lines/'):
+            parts = urllib.parse.urlsplit(self.path)
+            self.handle_lines(parts.path[7:], urllib.parse.parse_qs(parts.query))
+            return
+        
+        # Handle /search/* requests - full-text search over extracted points
+        if self.path.startswith('/search/'):
+            parts = urllib.parse.urlsplit(self.path)
+            self.handle_search(parts.path[8:], urllib.parse.parse_qs(parts.query))
+            return
+        
+        # Handle /sqlite/* requests - queries on a log2json --sqlite database
+        if self.path.startswith('/sqlite/'):
+            parts = urllib.parse.urlsplit(self.path)
+            self.handle_sqlite(parts.path[8:], urllib.parse.parse_qs(parts.query))
+            return
+        
         # Handle /file/* requests - serve any file by absolute path
         # URL format: /file/D:/path/to/file.json or /file//server/share/file.json (UNC)
         if self.path.startswith('/file/'):
@@ -60,6 +683,9 @@ if __name__ == "__main__":
         print(f"Quick Log server running at http://localhost:{PORT}")
         print(f"  Serving: {DIST_DIR}")
         print(f"  Files via: /file/<absolute_path>")
+        print(f"  Log lines via: /lines/<absolute_log_path>?start=N&end=M")
+        print(f"  Search via: /search/<absolute_json_path>?q=text")
+        print(f"  SQLite via: /sqlite/<absolute_db_path>?t0=ms&t1=ms")
         print("Press Ctrl+C to stop.")
         try:
             httpd.serve_forever()
@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import type { ChartData, Annotation, VLine, RawData, ClassHierarchy, TimelinePoint, SeriesDataPoint } from '@/types'
-import { processRawData, recalculateSeries } from '@/utils'
+import { processRawData, recalculateSeries, setLineSource } from '@/utils'
 
 export const useTimelineStore = defineStore('timeline', () => {
   // 原始数据
@@ -54,6 +54,7 @@ export const useTimelineStore = defineStore('timeline', () => {
     rawData.value = data
     title.value = data.name || 'Timeline Visualization'
     chartData.value = processRawData(data)
+    setLineSource(data.source)
 
     // 初始化所有子类为可见
     visibleSubclasses.value = new Set(chartData.value.yAxisData)
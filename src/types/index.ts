@@ -1,7 +1,7 @@
 // 原始 JSON 数据中的点
 export interface RawPoint {
   cursor: string
-  msg: string
+  msg?: string // log2json --no-msg 时省略，通过 serve.py /lines/ 按行号获取
   line: number
   timestamp: number // 毫秒时间戳
   layer: number
@@ -11,18 +11,28 @@ export interface RawPoint {
 export interface RawSubClass {
   subclassname: string
   points: RawPoint[]
+  dropped?: number // 超过 max_points 被丢弃的点数
 }
 
 // 原始 JSON 数据中的类
 export interface RawClass {
   classname: string
   subclasses: RawSubClass[]
+  dropped_rules?: Record<string, number> // 规则 pattern -> 超过 max_points 被丢弃的匹配数
+}
+
+// 原始日志来源（log2json --line-index / --no-msg 生成）
+export interface RawSource {
+  log: string        // 原始日志绝对路径
+  line_index: string // 行号 -> 字节偏移索引文件 (.lineidx)
+  lines: number      // 日志总行数
 }
 
 // 原始 JSON 数据结构
 export interface RawData {
   name: string
   all: RawClass[]
+  source?: RawSource
 }
 
 // 处理后的时间点数据
@@ -1,3 +1,4 @@
 export * from './time'
 export * from './colors'
 export * from './dataProcessor'
+export * from './logLines'
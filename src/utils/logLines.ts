@@ -0,0 +1,92 @@
+/**
+ * 原始日志行获取（log2json --no-msg 生成的 JSON 不含 msg）
+ */
+import { reactive } from 'vue'
+import type { RawSource } from '@/types'
+
+// 相邻缺失行间隔不超过该值时合并为一次请求
+const MERGE_GAP = 32
+// 与 serve.py MAX_LINES 一致
+const MAX_RANGE = 10000
+
+let source: RawSource | null = null
+const lineTexts = reactive(new Map<number, string>())
+const inflight = new Set<number>()
+
+/**
+ * 设置当前数据的原始日志来源，并清空已缓存的行
+ */
+export function setLineSource(src?: RawSource | null) {
+  source = src || null
+  lineTexts.clear()
+  inflight.clear()
+}
+
+/**
+ * 点的消息文本：优先使用 JSON 中的 msg，否则使用已获取的日志行
+ */
+export function getPointMsg(point: { msg?: string; line: number }): string {
+  if (point.msg) return point.msg
+  return lineTexts.get(point.line) ?? ''
+}
+
+/**
+ * 返回需要从原始日志获取文本的行号
+ */
+export function missingLines(points: { msg?: string; line: number }[]): number[] {
+  if (!source) return []
+  return points
+    .filter(p => !p.msg && !lineTexts.has(p.line) && !inflight.has(p.line))
+    .map(p => p.line)
+}
+
+function linesUrl(src: RawSource, start: number, end: number): string {
+  // D:\logs\1.log -> D:/logs/1.log, \\server\share -> //server/share
+  const logPath = src.log.replace(/\\/g, '/').split('/').map(encodeURIComponent).join('/')
+  const params = new URLSearchParams({ start: String(start), end: String(end) })
+  if (src.line_index) params.set('index', src.line_index)
+  return `/lines/${logPath}?${params}`
+}
+
+/**
+ * 通过 serve.py 的 /lines/ 接口获取行文本，相邻行合并请求
+ * 获取失败的行记为空串，不再重复请求
+ */
+export async function fetchLines(lines: number[]): Promise<void> {
+  const src = source
+  if (!src || lines.length === 0) return
+
+  const sorted = [...new Set(lines)].sort((a, b) => a - b)
+  const ranges: [number, number][] = []
+  for (const line of sorted) {
+    const last = ranges[ranges.length - 1]
+    if (last && line - last[1] <= MERGE_GAP && line - last[0] < MAX_RANGE) {
+      last[1] = line
+    } else {
+      ranges.push([line, line])
+    }
+  }
+  sorted.forEach(line => inflight.add(line))
+
+  await Promise.all(ranges.map(async ([start, end]) => {
+    let texts: string[] = []
+    let first = start
+    try {
+      const response = await fetch(linesUrl(src, start, end))
+      if (response.ok) {
+        const data = await response.json()
+        texts = data.lines || []
+        first = data.start
+      }
+    } catch (err) {
+      console.error('获取日志行失败:', err)
+    }
+    // 数据源已切换则丢弃结果
+    if (source !== src) return
+    for (const line of sorted) {
+      if (line < start || line > end) continue
+      lineTexts.set(line, texts[line - first] ?? '')
+      inflight.delete(line)
+    }
+  }))
+}